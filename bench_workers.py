@@ -0,0 +1,95 @@
+"""
+Бенчмарк режима шардов: пропускная способность в зависимости от числа воркеров.
+
+Каждый «апдейт» — то, что делает бот на 📦 Мой пластик / 📁 Архив:
+читаем все катушки и строим большую клавиатуру. Каждый 10-й апдейт —
+списание граммов через процесс-писатель.
+
+    python bench_workers.py            # воркеры 1, 2, 4, 8
+    python bench_workers.py 1 2 4 --updates 4000 --spools 500
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+# Всегда своя временная БД: DB_PATH может указывать на рабочую базу бота
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import bot  # noqa: E402  (DB_PATH должен быть задан до импорта)
+
+SYNC = "sync"
+
+
+def bench_shard(shard, jobs, requests, replies, writer_sentinel, ready):
+    bot._writer = bot.WriterClient(requests, replies, shard, writer_sentinel)
+    ready.put(shard)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        if job == SYNC:
+            ready.put(shard)
+            continue
+        _chat_id, spool_id = job
+        if spool_id is not None:
+            bot.subtract_grams(spool_id, 1, "bench")
+        rows = bot.get_spools(active_only=False)
+        json.dumps(bot.kb_spools([r[:5] for r in rows]).to_dict(), ensure_ascii=False)
+
+
+def seed(spools: int):
+    bot.init_db()
+    for i in range(spools):
+        bot.add_spool(f"Brand{i % 17}", f"PLA{i % 5}", f"Color {i}")
+
+
+def wait_all(ready, workers: int):
+    for _ in range(workers):
+        ready.get()
+
+
+def run(workers: int, updates: int, spools: int) -> float:
+    ready = bot.pool_context().Queue()
+    jobs, requests, writer, procs = bot.start_pool(workers, bench_shard, lambda i: (ready,))
+    try:
+        # Запуск процессов не меряем: таймер стартует, когда все воркеры готовы,
+        # и останавливается, когда каждый доработал до SYNC
+        wait_all(ready, workers)
+        start = time.perf_counter()
+        for n in range(updates):
+            chat_id = 1000 + n % 64
+            spool_id = n % spools + 1 if n % 10 == 0 else None
+            jobs[bot.shard_for(chat_id, workers)].put((chat_id, spool_id))
+        for q in jobs:
+            q.put(SYNC)
+        wait_all(ready, workers)
+        elapsed = time.perf_counter() - start
+    finally:
+        bot.stop_pool(jobs, requests, writer, procs)
+    return updates / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("workers", nargs="*", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--spools", type=int, default=300)
+    args = parser.parse_args()
+
+    seed(args.spools)
+    cpus = os.cpu_count() or 1
+    print(f"CPU: {cpus}, апдейтов: {args.updates}, катушек: {args.spools}")
+    if max(args.workers) > cpus:
+        print(f"Внимание: прирост возможен только до {cpus} воркеров (по числу CPU)")
+    base = None
+    for w in args.workers:
+        rate = run(w, args.updates, args.spools)
+        base = base or rate
+        note = "  (воркеров больше, чем CPU)" if w > cpus else ""
+        print(f"workers={w:<3} {rate:8.0f} апд/с  x{rate / base:.2f}{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
+import asyncio
+import functools
+import multiprocessing as mp
 import os
+import pickle
+import queue
 import re
+import signal
 import sqlite3
 from datetime import datetime
+from multiprocessing.connection import wait as mp_wait
 from urllib.parse import quote_plus
 
 from telegram import (
@@ -9,10 +16,10 @@ from telegram import (
 )
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, ContextTypes,
-    ConversationHandler, filters
+    ConversationHandler, TypeHandler, filters
 )
 
-DB_PATH = "plastic.db"
+DB_PATH = os.environ.get("DB_PATH", "plastic.db")
 SPOOL_DEFAULT_GRAMS = 1000
 
 # --- Состояния ---
@@ -28,13 +35,32 @@ MODE_NONE = None
 RE_SPOOL_PICK = re.compile(r"^\s*(\d+)\.\s+")  # "1. Brand Type Color — 1000 г"
 
 # ------------------ DB ------------------
+# В режиме шардов (WORKERS > 1) все изменения идут через один процесс-писатель,
+# воркеры только читают. Здесь лежит клиент писателя; None — пишем напрямую.
+_writer = None
+WRITE_OPS = {}
+
 def db():
     return sqlite3.connect(DB_PATH)
 
+def write_op(fn):
+    """Изменяющая операция: в воркере уходит в процесс-писатель, иначе выполняется на месте."""
+    WRITE_OPS[fn.__name__] = fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _writer is None:
+            return fn(*args, **kwargs)
+        return _writer.call(fn.__name__, args, kwargs)
+    return wrapper
+
 def init_db():
     conn = db()
     c = conn.cursor()
 
+    # WAL: читатели не блокируются писателем (нужно для воркеров)
+    c.execute("PRAGMA journal_mode=WAL")
+
     c.execute("""
         CREATE TABLE IF NOT EXISTS spools (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -69,6 +95,7 @@ def init_db():
     conn.commit()
     conn.close()
 
+@write_op
 def dict_add(kind: str, value: str):
     value = value.strip()
     if not value:
@@ -87,6 +114,7 @@ def dict_list(kind: str, limit: int = 20):
     conn.close()
     return rows
 
+@write_op
 def add_spool(brand: str, ptype: str, color: str):
     brand, ptype, color = brand.strip(), ptype.strip(), color.strip()
     conn = db()
@@ -121,6 +149,7 @@ def get_spool(spool_id: int):
     conn.close()
     return row
 
+@write_op
 def subtract_grams(spool_id: int, grams: int, note: str | None):
     conn = db()
     c = conn.cursor()
@@ -151,6 +180,7 @@ def subtract_grams(spool_id: int, grams: int, note: str | None):
     conn.close()
     return new_remaining
 
+@write_op
 def archive_spool(spool_id: int):
     conn = db()
     c = conn.cursor()
@@ -158,6 +188,7 @@ def archive_spool(spool_id: int):
     conn.commit()
     conn.close()
 
+@write_op
 def unarchive_spool(spool_id: int):
     conn = db()
     c = conn.cursor()
@@ -266,8 +297,12 @@ async def add_brand(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Ок, введи новый бренд:")
         return ADD_BRAND
 
+    try:
+        dict_add("brand", t)
+    except Exception as e:
+        await update.message.reply_text(f"Ошибка: {e}")
+        return ADD_BRAND
     context.user_data["brand"] = t
-    dict_add("brand", t)
 
     types_ = dict_list("ptype", 12)
     if types_:
@@ -289,8 +324,12 @@ async def add_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Ок, введи новый тип:")
         return ADD_TYPE
 
+    try:
+        dict_add("ptype", t)
+    except Exception as e:
+        await update.message.reply_text(f"Ошибка: {e}")
+        return ADD_TYPE
     context.user_data["ptype"] = t
-    dict_add("ptype", t)
 
     colors = dict_list("color", 12)
     if colors:
@@ -320,7 +359,11 @@ async def add_color(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Что-то пошло не так. Начни заново: /master", reply_markup=kb_main())
         return ConversationHandler.END
 
-    add_spool(brand, ptype, color)
+    try:
+        add_spool(brand, ptype, color)
+    except Exception as e:
+        await update.message.reply_text(f"Ошибка: {e}")
+        return ADD_COLOR
     context.user_data[MODE_KEY] = MODE_NONE
 
     await update.message.reply_text(
@@ -464,7 +507,11 @@ async def archive_current(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not sid:
         await update.message.reply_text("Сначала выбери катушку.", reply_markup=kb_main())
         return
-    archive_spool(sid)
+    try:
+        archive_spool(sid)
+    except Exception as e:
+        await update.message.reply_text(f"Ошибка: {e}", reply_markup=kb_spool_actions())
+        return
     await update.message.reply_text("Катушка отправлена в архив.", reply_markup=kb_main())
 
 async def show_archive(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -487,7 +534,11 @@ async def cmd_unarchive(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Формат: /unarchive ID\nНапример: /unarchive 12", reply_markup=kb_main())
         return
     sid = int(args[1])
-    unarchive_spool(sid)
+    try:
+        unarchive_spool(sid)
+    except Exception as e:
+        await update.message.reply_text(f"Ошибка: {e}", reply_markup=kb_main())
+        return
     await update.message.reply_text(f"Катушка {sid} возвращена из архива.", reply_markup=kb_main())
 
 # ------------------ Инфо / Купить / Поиск ------------------
@@ -608,7 +659,11 @@ async def router(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Формат: Бренд Тип Цвет (минимум 3 слова). Попробуй ещё раз.")
             return
         brand, ptype, color = parsed
-        add_spool(brand, ptype, color)
+        try:
+            add_spool(brand, ptype, color)
+        except Exception as e:
+            await update.message.reply_text(f"Ошибка: {e}")
+            return
         context.user_data[MODE_KEY] = MODE_NONE
         await update.message.reply_text(
             f"✅ Добавлена катушка:\n{brand} {ptype} {color} — {SPOOL_DEFAULT_GRAMS} г",
@@ -622,14 +677,162 @@ async def router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=kb_main()
     )
 
-# ------------------ main ------------------
-def main():
-    init_db()
-    token = os.environ.get("BOT_TOKEN")
-    if not token:
-        raise RuntimeError("Не задана переменная окружения BOT_TOKEN (Render → Environment Variables)")
+# ------------------ Шарды / процесс-писатель ------------------
+def pool_context():
+    # fork: воркеры наследуют sentinel писателя и могут проверять, жив ли он.
+    # Берём контекст только при запуске пула — обычный режим от fork не зависит.
+    try:
+        return mp.get_context("fork")
+    except ValueError:
+        raise RuntimeError("Режим WORKERS > 1 требует fork (Linux/macOS)") from None
+
+class WriterClient:
+    """Клиент процесса-писателя. Воркер обрабатывает апдейты по одному,
+    поэтому в его очереди ответов всегда не больше одного ответа."""
+
+    def __init__(self, requests, replies, shard: int, writer_sentinel: int):
+        self.requests = requests
+        self.replies = replies
+        self.shard = shard
+        self.writer_sentinel = writer_sentinel
+
+    def call(self, op: str, args, kwargs):
+        self.requests.put((self.shard, op, args, kwargs))
+        # Дедлайна нет: запрос в очереди живого писателя всё равно выполнится,
+        # и «ошибка» по таймауту привела бы к повторному списанию.
+        # Падаем, только если писатель умер.
+        while True:
+            try:
+                ok, result = self.replies.get(timeout=1)
+                break
+            except queue.Empty:
+                if mp_wait([self.writer_sentinel], 0):
+                    raise RuntimeError("процесс записи в БД остановлен")
+        if not ok:
+            raise result
+        return result
+
+def run_writer(requests, replies):
+    """Единственный процесс, который пишет в БД. Операции выполняются строго по очереди."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        msg = requests.get()
+        if msg is None:
+            break
+        shard, op, args, kwargs = msg
+        try:
+            result = (True, WRITE_OPS[op](*args, **kwargs))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(str(e))
+            result = (False, e)
+        replies[shard].put(result)
+    # живые воркеры свои ответы уже забрали; ответы мёртвым не ждём при выходе
+    for q in replies:
+        q.cancel_join_thread()
+
+def shard_for(chat_id: int, workers: int) -> int:
+    # Один чат всегда попадает в один воркер — порядок апдейтов чата сохраняется,
+    # состояния ConversationHandler и user_data живут в памяти этого воркера
+    return chat_id % workers
+
+def start_pool(workers: int, target, args_for):
+    """Запускает писателя и воркеров:
+    target(shard, jobs, requests, replies, writer_sentinel, *args_for(shard))."""
+    ctx = pool_context()
+    requests = ctx.Queue()
+    replies = [ctx.Queue() for _ in range(workers)]
+    jobs = [ctx.Queue() for _ in range(workers)]
+
+    # daemon: если родителя убьют, дочерние процессы не останутся висеть на get()
+    writer = ctx.Process(target=run_writer, args=(requests, replies), name="db-writer", daemon=True)
+    writer.start()
+
+    procs = []
+    for i in range(workers):
+        p = ctx.Process(
+            target=target,
+            args=(i, jobs[i], requests, replies[i], writer.sentinel, *args_for(i)),
+            name=f"shard-{i}",
+            daemon=True,
+        )
+        p.start()
+        procs.append(p)
+    return jobs, requests, writer, procs
+
+def stop_pool(jobs, requests, writer, procs):
+    # Сначала дожидаемся воркеров (они могут ещё писать), потом гасим писателя
+    for q, p in zip(jobs, procs):
+        if p.is_alive():
+            q.put(None)
+    for p in procs:
+        p.join()
+    # Воркеров больше нет — недочитанные задачи не нужны, не ждём их сброса в pipe
+    for q in jobs:
+        q.cancel_join_thread()
+
+    if writer.is_alive():
+        requests.put(None)
+    writer.join()
+    requests.cancel_join_thread()
+
+def dead_processes(writer, procs):
+    return [p.name for p in (writer, *procs) if not p.is_alive()]
+
+def run_shard(shard: int, jobs, requests, replies, writer_sentinel: int, token: str):
+    global _writer
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _writer = WriterClient(requests, replies, shard, writer_sentinel)
+    try:
+        asyncio.run(_shard_loop(token, jobs))
+    finally:
+        # запрос мёртвому писателю никто не прочитает — не зависаем на выходе
+        requests.cancel_join_thread()
+
+async def _shard_loop(token: str, jobs):
+    app = build_app(token, updater=False)
+    loop = asyncio.get_running_loop()
+    async with app:
+        await app.start()
+        while True:
+            data = await loop.run_in_executor(None, jobs.get)
+            if data is None:
+                break
+            await app.process_update(Update.de_json(data, app.bot))
+        await app.stop()
+
+def run_sharded(token: str, workers: int):
+    jobs, requests, writer, procs = start_pool(workers, run_shard, lambda i: (token,))
+
+    async def dispatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat = update.effective_chat
+        shard = shard_for(chat.id if chat else 0, workers)
+        # Воркер или писатель упал — апдейты этого шарда никто не обработает.
+        # Останавливаемся целиком, чтобы хостинг перезапустил бота.
+        if not procs[shard].is_alive() or not writer.is_alive():
+            context.application.stop_running()
+            raise RuntimeError(f"Остановлены процессы: {', '.join(dead_processes(writer, procs))}")
+        jobs[shard].put(update.to_dict())
 
     app = Application.builder().token(token).build()
+    app.add_handler(TypeHandler(Update, dispatch))
+    try:
+        app.run_polling()
+    finally:
+        dead = dead_processes(writer, procs)
+        stop_pool(jobs, requests, writer, procs)
+    if dead:
+        raise RuntimeError(f"Бот остановлен: упали процессы {', '.join(dead)}")
+
+# ------------------ main ------------------
+def build_app(token: str, updater: bool = True):
+    builder = Application.builder().token(token)
+    if not updater:
+        # Воркер шарда: апдейты приходят из очереди, а не из polling
+        builder = builder.updater(None)
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("help", cmd_help))
@@ -658,7 +861,21 @@ def main():
 
     # Роутер
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, router))
+    return app
+
+def main():
+    init_db()
+    token = os.environ.get("BOT_TOKEN")
+    if not token:
+        raise RuntimeError("Не задана переменная окружения BOT_TOKEN (Render → Environment Variables)")
+
+    # WORKERS > 1 — апдейты раскидываются по процессам по chat id
+    workers = int(os.environ.get("WORKERS", "1"))
+    if workers > 1:
+        run_sharded(token, workers)
+        return
 
+    app = build_app(token)
     app.run_polling()
 
 if __name__ == "__main__":